@@ -1,7 +1,72 @@
 import numpy as np
 import pandas as pd
 import PySimpleGUI as sg
+import csv
+import functools
+import math
 import os
+import threading
+
+# Polynomials up to this degree are fitted from float32 y-values. The fitting
+# operator is built in float64, but applying it in float32 leaves coefficient
+# errors that the large high-power terms (x^5 is about 2.5e10 at x = 120)
+# amplify past the 0.01 resolution of the data above degree 4
+_FLOAT32_MAX_DEGREE = 4
+
+@functools.lru_cache(maxsize=32)
+def _least_squares_system(x_key, degree):
+    """
+    Build the Vandermonde matrix of an x-grid and its least-squares fitting
+    operator (pseudo-inverse). Cached, so files sharing the same x-grid reuse both.
+    Both are computed in float64; the operator is stored in float32 up to
+    _FLOAT32_MAX_DEGREE.
+
+    Parameters:
+    x_key (tuple): x-values of the data points, rounded to 12 decimals.
+    degree (int): Degree of the polynomial to fit.
+
+    Returns:
+    tuple: Read-only float64 Vandermonde matrix (increasing powers) and read-only
+        matrix mapping y-values to polynomial coefficients in ascending order.
+    """
+    if degree < 0:
+        raise ValueError("Degree of the polynomial should not be negative.")
+    if degree >= len(x_key):
+        raise ValueError("Degree of the polynomial should be less than the number of points.")
+
+    vandermonde = np.vander(np.array(x_key), degree + 1, increasing=True)
+    # Scale the Vandermonde columns to unit norm to keep the least-squares problem well conditioned
+    scale = np.sqrt((vandermonde * vandermonde).sum(axis=0))
+    fit_operator = np.linalg.pinv(vandermonde / scale) / scale[:, np.newaxis]
+
+    if degree <= _FLOAT32_MAX_DEGREE:
+        fit_operator = fit_operator.astype(np.float32)
+    vandermonde.setflags(write=False)
+    fit_operator.setflags(write=False)
+    return vandermonde, fit_operator
+
+@functools.lru_cache(maxsize=None)
+def _make_horner_evaluator(degree):
+    """
+    Generate a Horner evaluator unrolled for a fixed polynomial degree. Cached,
+    so each degree is generated only once.
+
+    Parameters:
+    degree (int): Degree of the polynomials to evaluate.
+
+    Returns:
+    function: evaluate(coefficients, x_values), taking coefficients in ascending
+        order (one column per series) and returning one row of values per series.
+    """
+    expression = f"c[{degree}][..., np.newaxis]"
+    for power in range(degree - 1, -1, -1):
+        expression = f"({expression}) * x + c[{power}][..., np.newaxis]"
+    if degree == 0:
+        expression += " + np.zeros_like(x)"
+
+    namespace = {"np": np}
+    exec(f"def evaluate(c, x):\n    return {expression}\n", namespace)
+    return namespace["evaluate"]
 
 def polynomial_interpolation(x_points, y_points, degree):
     """
@@ -10,53 +75,83 @@ def polynomial_interpolation(x_points, y_points, degree):
 
     Parameters:
     x_points (array-like): x-values of the data points.
-    y_points (array-like): y-values of the data points.
+    y_points (array-like): y-values of the data points, either a single series
+        or a 2D array with one series per column.
     degree (int): Degree of the polynomial to fit.
 
     Returns:
-    polynomial (np.poly1d): Polynomial function.
+    np.ndarray: Float64 polynomial coefficients in ascending order, with one column per series.
     """
-    if degree >= len(x_points):
-        raise ValueError("Degree of the polynomial should be less than the number of points.")
+    x_points = np.asarray(x_points, dtype=np.float64)
+    fit_operator = _least_squares_system(tuple(x_points.round(12)), degree)[1]
+    y_points = np.asarray(y_points, dtype=fit_operator.dtype)
 
     # Ensure polynomial passes through (0, y(0)) exactly
     y_zero = y_points[0]  # The actual y-value at x = 0
     adjusted_y_points = y_points - y_zero  # Shift y-values by y(0)
-    coefficients = np.polyfit(x_points, adjusted_y_points, degree)
-    coefficients[-1] += y_zero  # Adjust constant term to satisfy y(0)
+    # Fits all series at once; the coefficients are returned in float64 for evaluation
+    coefficients = (fit_operator @ adjusted_y_points).astype(np.float64)
+    coefficients[0] += y_zero  # Adjust constant term to satisfy y(0)
 
-    polynomial = np.poly1d(coefficients)
-    return polynomial
+    return coefficients
 
-def find_y_for_missing_x(polynomial, x_values):
+def find_y_for_missing_x(coefficients, x_values):
     """
-    Compute the y-values for missing x-values using the polynomial.
+    Compute the y-values for missing x-values using the polynomial coefficients.
 
     Parameters:
-    polynomial (np.poly1d): Polynomial function.
+    coefficients (np.ndarray): Polynomial coefficients in ascending order, one column per series.
     x_values (array-like): Array of x-values where y-values are to be estimated.
 
     Returns:
-    np.ndarray: Estimated y-values for missing x-values.
+    np.ndarray: Estimated y-values for missing x-values, one row per series.
     """
-    return polynomial(x_values)
+    x_values = np.asarray(x_values, dtype=np.float64)
+    return _make_horner_evaluator(len(coefficients) - 1)(coefficients, x_values)
 
-def calculate_squared_error(polynomial, x_points, y_points):
+def calculate_squared_error(vandermonde, coefficients, y_points):
     """
     Calculate the squared error between actual and predicted y-values.
 
     Parameters:
-    polynomial (np.poly1d): Polynomial function.
-    x_points (array-like): Original x-values.
-    y_points (array-like): Original y-values.
+    vandermonde (np.ndarray): Vandermonde matrix of the original x-values.
+    coefficients (np.ndarray): Polynomial coefficients in ascending order, one column per series.
+    y_points (array-like): Original y-values, one column per series.
 
     Returns:
-    float: Sum of squared errors.
+    np.ndarray: Sum of squared errors for each series.
     """
-    y_predicted = polynomial(x_points)
-    squared_error = np.sum((y_points - y_predicted) ** 2)
+    y_predicted = vandermonde @ coefficients
+    squared_error = np.sum((y_points - y_predicted) ** 2, axis=0)
     return squared_error
 
+def format_polynomial(coefficients):
+    """
+    Format polynomial coefficients as a readable expression, highest power first.
+
+    Parameters:
+    coefficients (array-like): Polynomial coefficients in ascending order.
+
+    Returns:
+    str: The polynomial written as e.g. "1.5 x^2 - 2 x + 3.25".
+    """
+    terms = []
+    for power in range(len(coefficients) - 1, -1, -1):
+        coefficient = coefficients[power]
+        sign = "-" if coefficient < 0 else "+"
+        value = f"{abs(coefficient):.4g}"
+        if power > 1:
+            value += f" x^{power}"
+        elif power == 1:
+            value += " x"
+        terms.append((sign, value))
+
+    first_sign, first_value = terms[0]
+    expression = f"-{first_value}" if first_sign == "-" else first_value
+    for sign, value in terms[1:]:
+        expression += f" {sign} {value}"
+    return expression
+
 def process_csv(file_path, degree, missing_x_values):
     """
     Process CSV data by fitting a polynomial to each series and calculating missing y-values.
@@ -67,28 +162,33 @@ def process_csv(file_path, degree, missing_x_values):
     missing_x_values (array-like): x-values for which y-values are to be estimated.
 
     Returns:
-    dict: Results containing polynomial, missing y-values, and squared error for each y-series.
+    tuple: Results dictionary containing polynomial coefficients, missing y-values, and squared
+        error for each y-series, and the list of column names from the CSV header.
     """
-    data = pd.read_csv(file_path, skiprows=1)
-    x_points = data.iloc[:, 0].values  # First column as x_points
-    y_series = data.iloc[:, 1:].values  # Remaining columns as y_points series
+    # Read the header row once and skip the first row below it; values are parsed straight to float
+    data = pd.read_csv(file_path, skiprows=[1], engine="c", dtype=np.float64)
+    header = data.columns.tolist()
+    x_points = data.iloc[:, 0].to_numpy(dtype=np.float64, copy=False)  # First column as x_points
+    # The fitting operator sets the working precision of the remaining columns (y_points series)
+    vandermonde, fit_operator = _least_squares_system(tuple(x_points.round(12)), degree)
+    y_series = data.iloc[:, 1:].to_numpy(dtype=fit_operator.dtype)
+
+    coefficients = polynomial_interpolation(x_points, y_series, degree)
+    missing_y_series = find_y_for_missing_x(coefficients, missing_x_values)
+    squared_errors = calculate_squared_error(vandermonde, coefficients, y_series)
 
     results = {}
-    
-    for i, y_points in enumerate(y_series.T):
-        polynomial = polynomial_interpolation(x_points, y_points, degree)
-        missing_y_values = find_y_for_missing_x(polynomial, missing_x_values)
-        squared_error = calculate_squared_error(polynomial, x_points, y_points)
-        
+
+    for i in range(y_series.shape[1]):
         results[f'y_series_{i+1}'] = {
-            'polynomial': polynomial,
-            'missing_y_values': missing_y_values,
-            'squared_error': squared_error
+            'coefficients': coefficients[:, i],
+            'missing_y_values': missing_y_series[i],
+            'squared_error': squared_errors[i]
         }
-        
-    return results
 
-def save_results_to_csv_and_txt(results, missing_x_values, input_file_path):
+    return results, header
+
+def save_results_to_csv_and_txt(results, missing_x_values, input_file_path, original_header):
     """
     Save missing y-values to a CSV and details for each series to a text file.
 
@@ -96,29 +196,68 @@ def save_results_to_csv_and_txt(results, missing_x_values, input_file_path):
     results (dict): Dictionary containing results for each series.
     missing_x_values (array-like): x-values for which y-values were estimated.
     input_file_path (str): Original path of the input file for saving output.
+    original_header (list): Column names of the input CSV, reused for the output CSV.
     """
     # Prepare output file paths
     base, ext = os.path.splitext(input_file_path)
     output_csv_path = f"{base}_output{ext}"
     output_txt_path = f"{base}_output.txt"
     
-    # Load original CSV header and create output DataFrame
-    original_header = pd.read_csv(input_file_path, nrows=0).columns.tolist()
-    output_df = pd.DataFrame({'Missing X Values': missing_x_values})
-    
-    for series, result in results.items():
-        output_df[series] = result['missing_y_values']
-    
-    output_df.to_csv(output_csv_path, index=False, header=[*original_header])
+    # Write one row per missing x-value, with the estimate of every series
+    missing_y_rows = np.column_stack([result['missing_y_values'] for result in results.values()])
+    with open(output_csv_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file, lineterminator=os.linesep)
+        writer.writerow(original_header)
+        for x_value, y_values in zip(np.asarray(missing_x_values).tolist(), missing_y_rows):
+            # Leave estimates of empty series blank
+            writer.writerow([x_value] + ['' if math.isnan(y) else y for y in y_values])
     
     # Save detailed results to a text file
     with open(output_txt_path, 'w') as txt_file:
         for series, result in results.items():
             txt_file.write(f"Results for {series}:\n")
-            txt_file.write(f"Polynomial function: {result['polynomial']}\n")
+            txt_file.write(f"Polynomial function: {format_polynomial(result['coefficients'])}\n")
             txt_file.write(f"Missing y-values for x = {missing_x_values}: {result['missing_y_values']}\n")
             txt_file.write(f"Interpolation squared error: {result['squared_error']}\n\n")
 
+def run_on_file(file_path, degree, missing_x_values):
+    """
+    Interpolate a CSV file and save the results next to it. The file is read
+    and parsed once; its header is reused for the output CSV.
+
+    Parameters:
+    file_path (str): Path to the input CSV file.
+    degree (int): Degree of the polynomial.
+    missing_x_values (array-like): x-values for which y-values are to be estimated.
+
+    Returns:
+    dict: Results containing polynomial coefficients, missing y-values, and squared error for each y-series.
+    """
+    results, header = process_csv(file_path, degree, missing_x_values)
+    save_results_to_csv_and_txt(results, missing_x_values, file_path, header)
+    return results
+
+def process_and_save(file_path, degree, missing_x_values):
+    """
+    Process a CSV file and save its results, reporting the outcome as a message.
+    Meant to run on a worker thread so the GUI stays responsive.
+
+    Parameters:
+    file_path (str): Path to the input CSV file.
+    degree (int): Degree of the polynomial.
+    missing_x_values (array-like): x-values for which y-values are to be estimated.
+
+    Returns:
+    str: Message describing the outcome, to be printed by the GUI thread.
+    """
+    try:
+        run_on_file(file_path, degree, missing_x_values)
+        return "Process completed. Results saved to CSV and TXT files."
+    except ValueError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"An unexpected error occurred: {e}"
+
 def run_interpolation():
     """
     Run the interpolation process by selecting a CSV file and performing interpolation.
@@ -134,11 +273,22 @@ def run_interpolation():
         [sg.Output(size=(80, 20))]
     ]
 
-    window = sg.Window("Polynomial Interpolation Tool", layout)
+    # Closing the window with its X button is reported as an event, so it can be deferred like Exit
+    window = sg.Window("Polynomial Interpolation Tool", layout, enable_close_attempted_event=True)
+    worker = None
+    exit_requested = False
 
     while True:
         event, values = window.read()
-        if event in (sg.WINDOW_CLOSED, "Exit"):
+        if event == sg.WINDOW_CLOSED:
+            break
+
+        if event in (sg.WINDOW_CLOSE_ATTEMPTED_EVENT, "Exit"):
+            # Let a running file finish writing its outputs before the window closes
+            if worker is not None and worker.is_alive():
+                print("Waiting for the current file to finish before exiting...")
+                exit_requested = True
+                continue
             break
 
         if event == "Run":
@@ -152,16 +302,25 @@ def run_interpolation():
                     continue
 
                 print("Processing file:", file_path)
-                results = process_csv(file_path, degree, missing_x_values)
-                save_results_to_csv_and_txt(results, missing_x_values, file_path)
+                # Process on a worker thread and post the outcome back as a "-DONE-" event
+                window["Run"].update(disabled=True)
+                worker = threading.Thread(
+                    target=lambda: window.write_event_value(
+                        "-DONE-", process_and_save(file_path, degree, missing_x_values))
+                )
+                worker.start()
 
-                print("Process completed. Results saved to CSV and TXT files.")
-            
             except ValueError as e:
                 print(f"Error: {e}")
             except Exception as e:
                 print(f"An unexpected error occurred: {e}")
 
+        if event == "-DONE-":
+            print(values["-DONE-"])
+            window["Run"].update(disabled=False)
+            if exit_requested:
+                break
+
     window.close()
 
 # Run the PySimpleGUI-based interpolation tool
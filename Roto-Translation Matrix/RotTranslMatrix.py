@@ -18,7 +18,96 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 import numpy as np
-from scipy.spatial.transform import Rotation as R
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional: without it the helpers below run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+@njit(cache=True)
+def _cross3(a, b, out):
+    """
+    Cross product of two length-3 vectors, written out component-wise into
+    out to avoid the dispatch overhead of np.cross on such small inputs.
+    out must not share memory with a or b.
+    """
+    out[0] = a[1] * b[2] - a[2] * b[1]
+    out[1] = a[2] * b[0] - a[0] * b[2]
+    out[2] = a[0] * b[1] - a[1] * b[0]
+
+@njit(cache=True)
+def _rotation_matrix_from_points(new_origin, x_point, z_point):
+    """
+    Build the 3x3 rotation matrix whose columns are the orthonormal axes
+    of the coordinate system defined by the given points.
+    """
+    # The new basis vectors are written straight into the columns of the rotation matrix
+    rotation_matrix = np.empty((3, 3))
+    new_x_axis = rotation_matrix[:, 0]
+    new_y_axis = rotation_matrix[:, 1]
+    new_z_axis = rotation_matrix[:, 2]
+
+    # Calculate the new basis vectors for the new coordinate system.
+    # The y-axis is rebuilt from the x and z axes, so y_point is not needed.
+    for i in range(3):
+        new_x_axis[i] = x_point[i] - new_origin[i]
+        new_z_axis[i] = z_point[i] - new_origin[i]
+    x_norm = np.sqrt(new_x_axis[0] ** 2 + new_x_axis[1] ** 2 + new_x_axis[2] ** 2)
+    z_norm = np.sqrt(new_z_axis[0] ** 2 + new_z_axis[1] ** 2 + new_z_axis[2] ** 2)
+    for i in range(3):
+        new_x_axis[i] /= x_norm
+        new_z_axis[i] /= z_norm
+
+    # Ensure orthogonality by using the cross product
+    _cross3(new_z_axis, new_x_axis, new_y_axis)
+    y_norm = np.sqrt(new_y_axis[0] ** 2 + new_y_axis[1] ** 2 + new_y_axis[2] ** 2)
+    for i in range(3):
+        new_y_axis[i] /= y_norm
+    # x and y are orthonormal, so their cross product is already a unit vector
+    _cross3(new_x_axis, new_y_axis, new_z_axis)
+
+    return rotation_matrix
+
+@njit(cache=True)
+def _mat_to_quat(m):
+    """
+    Convert a 3x3 rotation matrix to a quaternion in [x, y, z, w] format
+    using Shepperd's method, branching on the largest of the trace and the
+    diagonal elements to keep the square root well conditioned. Ties go to
+    the diagonal elements, as in scipy's Rotation.from_matrix, so the sign
+    of the quaternion matches scipy's.
+    """
+    quaternion = np.empty(4)
+    trace = m[0, 0] + m[1, 1] + m[2, 2]
+    if trace > m[0, 0] and trace > m[1, 1] and trace > m[2, 2]:
+        s = 2.0 * np.sqrt(1.0 + trace)
+        quaternion[0] = (m[2, 1] - m[1, 2]) / s
+        quaternion[1] = (m[0, 2] - m[2, 0]) / s
+        quaternion[2] = (m[1, 0] - m[0, 1]) / s
+        quaternion[3] = 0.25 * s
+    elif m[0, 0] >= m[1, 1] and m[0, 0] >= m[2, 2]:
+        s = 2.0 * np.sqrt(1.0 + m[0, 0] - m[1, 1] - m[2, 2])
+        quaternion[0] = 0.25 * s
+        quaternion[1] = (m[0, 1] + m[1, 0]) / s
+        quaternion[2] = (m[0, 2] + m[2, 0]) / s
+        quaternion[3] = (m[2, 1] - m[1, 2]) / s
+    elif m[1, 1] >= m[2, 2]:
+        s = 2.0 * np.sqrt(1.0 + m[1, 1] - m[0, 0] - m[2, 2])
+        quaternion[0] = (m[0, 1] + m[1, 0]) / s
+        quaternion[1] = 0.25 * s
+        quaternion[2] = (m[1, 2] + m[2, 1]) / s
+        quaternion[3] = (m[0, 2] - m[2, 0]) / s
+    else:
+        s = 2.0 * np.sqrt(1.0 + m[2, 2] - m[0, 0] - m[1, 1])
+        quaternion[0] = (m[0, 2] + m[2, 0]) / s
+        quaternion[1] = (m[1, 2] + m[2, 1]) / s
+        quaternion[2] = 0.25 * s
+        quaternion[3] = (m[1, 0] - m[0, 1]) / s
+    return quaternion
 
 def calculate_rigid_transform(new_origin, x_point, y_point, z_point):
     """
@@ -39,45 +128,121 @@ def calculate_rigid_transform(new_origin, x_point, y_point, z_point):
     - translation_vector: The vector representing the translation from 
       the origin to the new origin.
     """
-    
-    # Calculate the new basis vectors for the new coordinate system
-    new_x_axis = (x_point - new_origin) / np.linalg.norm(x_point - new_origin)
-    new_y_axis = (y_point - new_origin) / np.linalg.norm(y_point - new_origin)
-    new_z_axis = (z_point - new_origin) / np.linalg.norm(z_point - new_origin)
-    
-    # Ensure orthogonality by using the cross product
-    new_y_axis = np.cross(new_z_axis, new_x_axis)
-    new_y_axis /= np.linalg.norm(new_y_axis)
-    new_z_axis = np.cross(new_x_axis, new_y_axis)
-    new_z_axis /= np.linalg.norm(new_z_axis)
-
-    # Create the rotation matrix from the new basis vectors
-    rotation_matrix = np.column_stack((new_x_axis, new_y_axis, new_z_axis))
+    rotation_matrix = _rotation_matrix_from_points(new_origin, x_point, z_point)
 
     # Convert the rotation matrix to a quaternion for easier use in 3D transformations
-    rotation_quaternion = R.from_matrix(rotation_matrix).as_quat()  # [x, y, z, w] format
+    rotation_quaternion = _mat_to_quat(rotation_matrix)  # [x, y, z, w] format
 
     # The translation vector is simply the new origin of the coordinate system
     translation_vector = new_origin
 
     return rotation_matrix, rotation_quaternion, translation_vector
 
-# Example usage of the calculate_rigid_transform function
-new_origin = np.array([1.0, 2.0, 3.0])
-x_point = np.array([1.0, 0.0, 0.0])
-y_point = np.array([0.0, 1.0, 0.0])
-z_point = np.array([0.0, 0.0, 1.0])
-
-# Compute the transformation matrix, quaternion, and translation vector
-rot_matrix, quaternion, translation = calculate_rigid_transform(new_origin, x_point, y_point, z_point)
-
-# Construct a 4x4 transformation matrix for homogeneous coordinates
-transform_matrix = np.eye(4)
-transform_matrix[:3,:3] = rot_matrix  # Set the rotation part
-transform_matrix[:3,3] = translation  # Set the translation part
-
-# Print the results
-print("Quaternion (x, y, z, w):", quaternion)
-print("Translation vector:", translation)
-print("4x4 transform matrix:")
-print(transform_matrix)
+def _mat_to_quat_batched(m):
+    """
+    Convert a stack of 3x3 rotation matrices with shape (N, 3, 3) to
+    quaternions in [x, y, z, w] format with shape (N, 4), using Shepperd's
+    method with the same branch selection as _mat_to_quat.
+
+    All four branches are evaluated for every matrix and the right one is
+    selected afterwards, so the conversion runs without per-branch masking.
+    """
+    m00, m01, m02 = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    m10, m11, m12 = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    m20, m21, m22 = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+    trace = m00 + m11 + m22
+
+    # Each candidate is the quaternion scaled by four times its pivot component,
+    # which avoids a square root per branch; normalizing removes the scale
+    candidates = np.stack((
+        np.stack((1.0 + m00 - m11 - m22, m01 + m10, m02 + m20, m21 - m12), axis=1),
+        np.stack((m01 + m10, 1.0 + m11 - m00 - m22, m12 + m21, m02 - m20), axis=1),
+        np.stack((m02 + m20, m12 + m21, 1.0 + m22 - m00 - m11, m10 - m01), axis=1),
+        np.stack((m21 - m12, m02 - m20, m10 - m01, 1.0 + trace), axis=1),
+    ), axis=1)
+
+    # For each matrix, pick the largest of the trace and the diagonal elements
+    # (ties go to the diagonal elements, as in scipy's Rotation.from_matrix)
+    choice = np.argmax(np.stack((m00, m11, m22, trace), axis=1), axis=1)
+    quaternions = np.take_along_axis(candidates, choice[:, np.newaxis, np.newaxis], axis=1)[:, 0]
+    quaternions /= np.sqrt(np.sum(quaternions * quaternions, axis=1, keepdims=True))
+    return quaternions
+
+def calculate_rigid_transforms(new_origin, x_point, y_point, z_point):
+    """
+    Calculate the rigid body transformations for many coordinate systems at
+    once. This is the batched version of calculate_rigid_transform, e.g. for
+    registering every frame of a recording in a single call.
+
+    Parameters:
+    - new_origin: The new origins of the coordinate systems (numpy array, shape (N, 3)).
+    - x_point: Points defining the new x-axis directions (numpy array, shape (N, 3)).
+    - y_point: Points defining the new y-axis directions (numpy array, shape (N, 3)).
+    - z_point: Points defining the new z-axis directions (numpy array, shape (N, 3)).
+
+    Returns:
+    - rotation_matrices: The rotation matrices, shape (N, 3, 3).
+    - rotation_quaternions: The quaternions representing the same rotations,
+      shape (N, 4).
+    - translation_vectors: The translation vectors, shape (N, 3).
+    """
+    new_origin = np.asarray(new_origin, dtype=float)
+
+    # Calculate the new basis vectors for every coordinate system
+    x_direction = x_point - new_origin
+    z_direction = z_point - new_origin
+    new_x_axes = x_direction / np.linalg.norm(x_direction, axis=1, keepdims=True)
+    new_z_axes = z_direction / np.linalg.norm(z_direction, axis=1, keepdims=True)
+
+    # Ensure orthogonality by using the cross product
+    new_y_axes = np.cross(new_z_axes, new_x_axes, axis=1)
+    new_y_axes /= np.linalg.norm(new_y_axes, axis=1, keepdims=True)
+    new_z_axes = np.cross(new_x_axes, new_y_axes, axis=1)
+
+    # Stack the basis vectors as the columns of each rotation matrix
+    rotation_matrices = np.stack((new_x_axes, new_y_axes, new_z_axes), axis=2)
+    rotation_quaternions = _mat_to_quat_batched(rotation_matrices)  # [x, y, z, w] format
+    translation_vectors = new_origin
+
+    return rotation_matrices, rotation_quaternions, translation_vectors
+
+def build_transform_matrix(rotation_matrix, translation_vector):
+    """
+    Assemble the 4x4 homogeneous transformation matrix from a rotation
+    matrix and a translation vector.
+
+    Parameters:
+    - rotation_matrix: The 3x3 rotation matrix, or a stack of them with
+      shape (N, 3, 3) (numpy array).
+    - translation_vector: The translation vector, or a stack of them with
+      shape (N, 3) (numpy array).
+
+    Returns:
+    - transform_matrix: The 4x4 transformation matrix, or a stack of them
+      with shape (N, 4, 4).
+    """
+    rotation_matrix = np.asarray(rotation_matrix)
+    transform_matrix = np.zeros(rotation_matrix.shape[:-2] + (4, 4))
+    transform_matrix[..., :3, :3] = rotation_matrix  # Set the rotation part
+    transform_matrix[..., :3, 3] = translation_vector  # Set the translation part
+    transform_matrix[..., 3, 3] = 1.0
+    return transform_matrix
+
+# Run the example usage of the calculate_rigid_transform function
+if __name__ == "__main__":
+    new_origin = np.array([1.0, 2.0, 3.0])
+    x_point = np.array([1.0, 0.0, 0.0])
+    y_point = np.array([0.0, 1.0, 0.0])
+    z_point = np.array([0.0, 0.0, 1.0])
+
+    # Compute the transformation matrix, quaternion, and translation vector
+    rot_matrix, quaternion, translation = calculate_rigid_transform(new_origin, x_point, y_point, z_point)
+
+    # Construct a 4x4 transformation matrix for homogeneous coordinates
+    transform_matrix = build_transform_matrix(rot_matrix, translation)
+
+    # Print the results
+    print("Quaternion (x, y, z, w):", quaternion)
+    print("Translation vector:", translation)
+    print("4x4 transform matrix:")
+    print(transform_matrix)